@@ -25,6 +25,11 @@ else
 fi
 
 gcloud config set project ${GCLOUD_PROJECT}
+
+# Deploy the shared WFL client alongside the function.
+cp -r ../wfl_client .
+trap 'rm -rf wfl_client' EXIT
+
 gcloud functions deploy submit_aou_workload \
     --region ${REGION} \
     --trigger-resource ${TRIGGER_BUCKET} \
@@ -3,6 +3,7 @@ import json
 import requests
 from google.cloud import storage
 from google.cloud import exceptions
+from wfl_client import Client, MetadataTokenProvider
 
 
 WFL_URL = os.environ.get('WFL_URL')
@@ -16,24 +17,17 @@ assert WFL_ENVIRONMENT is not None, 'WFL_ENVIRONMENT is not set'
 assert OUTPUT_BUCKET is not None, 'OUTPUT_BUCKET is not set'
 
 
-def get_auth_headers():
-    scopes = ','.join([
-        'https://www.googleapis.com/auth/cloud-platform',
-        'https://www.googleapis.com/auth/userinfo.email',
-        'https://www.googleapis.com/auth/userinfo.profile'
-    ])
-    metadata_url = (
-        'http://metadata.google.internal/computeMetadata/v1/'
-        f'instance/service-accounts/default/token?scopes={scopes}'
-    )
-    metadata_headers = {'Metadata-Flavor': 'Google'}
-    r = requests.get(metadata_url, headers=metadata_headers)
-    r.raise_for_status()
-    access_token = r.json()['access_token']
-    headers = {
-        'Authorization': 'Bearer {}'.format(access_token)
-    }
-    return headers
+_wfl_client = None
+
+
+def get_wfl_client():
+    """Return this instance's WFL client, so that warm invocations reuse
+    its cached token and pooled connections."""
+    global _wfl_client
+    if _wfl_client is None:
+        _wfl_client = Client(wfl_url=WFL_URL,
+                             token_provider=MetadataTokenProvider())
+    return _wfl_client
 
 
 def get_manifest_path(object_name):
@@ -47,7 +41,7 @@ def get_manifest_path(object_name):
     return '/'.join(manifest_segments)
 
 
-def get_or_create_workload(headers, environment):
+def get_or_create_workload(client, environment):
     output = f'{OUTPUT_BUCKET}/{environment.lower()}' \
         if environment else OUTPUT_BUCKET
     payload = {
@@ -56,29 +50,18 @@ def get_or_create_workload(headers, environment):
         'pipeline': 'AllOfUsArrays',
         'project': WFL_ENVIRONMENT
     }
-    response = requests.post(
-        url=f'{WFL_URL}/api/v1/exec',
-        headers=headers,
-        json=payload
-    )
-    return response.json().get('uuid')
+    return client.exec_workload(payload).get('uuid')
 
 
-def update_workload(headers, workload_uuid, input_data):
+def update_workload(client, workload_uuid, input_data):
     try:
         input_data['uuid'] = workload_uuid
         print(f'Updating workload {workload_uuid}')
-        response = requests.post(
-            url=f'{WFL_URL}/api/v1/append_to_aou',
-            headers=headers,
-            json=input_data
-        )
-        response.raise_for_status()
-        workflows = response.json()
+        workflows = client.append_to_aou(input_data)
         return [each['uuid'] for each in workflows]
     except requests.HTTPError as e:
-        print(f'The failed request: {response.request}')
-        print(f'The failed response: {response.text}')
+        print(f'The failed request: {e.response.request}')
+        print(f'The failed response: {e.response.text}')
         raise e
 
 
@@ -92,7 +75,7 @@ def submit_aou_workload(event, context):
          metadata. The `event_id` field contains the Pub/Sub message ID. The
          `timestamp` field contains the publish time.
     """
-    headers = get_auth_headers()
+    wfl = get_wfl_client()
 
     # Get sample manifest/metadata file
     client = storage.Client()
@@ -125,9 +108,9 @@ def submit_aou_workload(event, context):
     analysis_version = notification.get('analysis_version_number')
     print(f'Upload complete for {chip_well_barcode}-{analysis_version}')
     environment = notification.get('environment')
-    workload_uuid = get_or_create_workload(headers, environment)
+    workload_uuid = get_or_create_workload(wfl, environment)
     print(f'Updating workload: {workload_uuid}')
-    workflow_ids = update_workload(headers, workload_uuid, input_data)
+    workflow_ids = update_workload(wfl, workload_uuid, input_data)
     print(
         f'Started cromwell workflows: {workflow_ids}'
         f' for {chip_well_barcode}-{analysis_version}'
@@ -0,0 +1,108 @@
+""" Helper script that measures the end-to-end time from the upload of each sample recorded by
+upload_test_files.py --record to the submission of its Arrays workflow in Cromwell.
+
+Workflows are matched to samples by their chip_well_barcode and analysis_version_number labels.
+Use --workflows to read saved Cromwell query results instead of querying Cromwell, offline.
+
+Usage: python collect_submission_times.py uploads.jsonl [--cromwell <url> --poll 60 --timeout 3600]
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import time
+from datetime import datetime, timezone
+
+import requests
+
+cromwell_url = "https://cromwell-gotc-auth.gotc-dev.broadinstitute.org"
+
+def read_uploads(record):
+    with open(record) as f:
+        uploads = [json.loads(line) for line in f if line.strip()]
+    return {(u["chip_well_barcode"], str(u["analysis_version_number"])): u for u in uploads}
+
+def query_workflows(cromwell, since):
+    """Query CROMWELL for the Arrays workflows submitted after SINCE, with their labels."""
+    token = subprocess.check_output(["gcloud", "auth", "print-access-token"], encoding="utf-8").strip()
+    submission = datetime.fromtimestamp(since, timezone.utc).isoformat().replace("+00:00", "Z")
+    params = [{"name": "Arrays"}, {"submission": submission}, {"additionalQueryResultFields": "labels"}]
+    response = requests.post(f"{cromwell}/api/workflows/v1/query",
+                             headers={"Authorization": f"Bearer {token}"},
+                             json=params)
+    response.raise_for_status()
+    return response.json().get("results", [])
+
+def parse_timestamp(timestamp):
+    return datetime.fromisoformat(timestamp.replace("Z", "+00:00")).timestamp()
+
+def match_workflows(uploads, workflows):
+    """Return a map from each uploaded sample to its workflow id and seconds from upload to submission."""
+    matched = {}
+    for wf in workflows:
+        labels = wf.get("labels") or {}
+        key = (labels.get("chip_well_barcode"), labels.get("analysis_version_number"))
+        if key in uploads and "submission" in wf:
+            seconds = parse_timestamp(wf["submission"]) - uploads[key]["uploaded"]
+            if key not in matched or seconds < matched[key][1]:
+                matched[key] = (wf["id"], seconds)
+    return matched
+
+def summarize(uploads, matched):
+    for (barcode, version), (workflow_id, seconds) in sorted(matched.items(), key=lambda m: m[1][1]):
+        print(f"{barcode}-{version}\t{workflow_id}\t{seconds:.1f}s")
+    print(f"Matched {len(matched)} of {len(uploads)} uploaded samples to workflows")
+    if matched:
+        seconds = sorted(s for _, s in matched.values())
+        p95 = seconds[min(len(seconds) - 1, int(0.95 * len(seconds)))]
+        print(f"Upload to submission: min {seconds[0]:.1f}s, median {statistics.median(seconds):.1f}s, "
+              f"p95 {p95:.1f}s, max {seconds[-1]:.1f}s")
+
+def main(record, cromwell, workflows_file=None, poll=None, timeout=None):
+    uploads = read_uploads(record)
+    since = min(u["uploaded"] for u in uploads.values())
+    deadline = time.time() + (timeout or 0)
+    while True:
+        if workflows_file:
+            with open(workflows_file) as f:
+                workflows = json.load(f).get("results", [])
+        else:
+            workflows = query_workflows(cromwell, since)
+        matched = match_workflows(uploads, workflows)
+        if workflows_file or not poll or len(matched) == len(uploads) or time.time() >= deadline:
+            break
+        print(f"Matched {len(matched)} of {len(uploads)}; polling again in {poll}s")
+        time.sleep(poll)
+    summarize(uploads, matched)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "record",
+        help="The JSON lines file written by upload_test_files.py --record."
+    )
+    parser.add_argument(
+        "-c",
+        "--cromwell",
+        default=cromwell_url,
+        help="The Cromwell running the Arrays workflows."
+    )
+    parser.add_argument(
+        "--workflows",
+        help="Read Cromwell query results from this JSON file instead of querying Cromwell."
+    )
+    parser.add_argument(
+        "--poll",
+        type=float,
+        help="Query Cromwell every POLL seconds until every sample has a workflow."
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=3600,
+        help="Stop polling after this many seconds."
+    )
+    args = parser.parse_args()
+    main(args.record, args.cromwell, args.workflows, args.poll, args.timeout)
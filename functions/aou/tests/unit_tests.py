@@ -23,8 +23,8 @@ def test_get_manifest_path_from_uploaded_file():
 @mock.patch("aou.main.update_workload", return_value=["workflow_uuid"])
 @mock.patch("aou.main.get_or_create_workload", return_value="workload_uuid")
 @mock.patch.object(storage.Blob, 'download_as_string')
-@mock.patch("aou.main.get_auth_headers")
-def test_manifest_file_not_uploaded(mock_headers, mock_download, mock_get_workload, mock_update_workload):
+@mock.patch("aou.main.get_wfl_client")
+def test_manifest_file_not_uploaded(mock_client, mock_download, mock_get_workload, mock_update_workload):
     client = mock.create_autospec(storage.Client())
     mock_download.side_effect = exceptions.NotFound('Error')
     main.submit_aou_workload(event_data, None)
@@ -35,8 +35,8 @@ def test_manifest_file_not_uploaded(mock_headers, mock_download, mock_get_worklo
 @mock.patch("aou.main.get_or_create_workload", return_value="workload_uuid")
 @mock.patch.object(storage.Bucket, 'get_blob')
 @mock.patch.object(storage.Blob, 'download_as_string')
-@mock.patch("aou.main.get_auth_headers")
-def test_input_file_not_uploaded(mock_headers, mock_download, mock_get_blob, mock_get_workload, mock_update_workload):
+@mock.patch("aou.main.get_wfl_client")
+def test_input_file_not_uploaded(mock_client, mock_download, mock_get_blob, mock_get_workload, mock_update_workload):
     client = mock.create_autospec(storage.Client())
     mock_download.return_value = '{"notifications": [{"file": "gs://test_bucket/file.txt", "environment": "dev"}]}'
     mock_get_blob.return_value = None
@@ -48,8 +48,8 @@ def test_input_file_not_uploaded(mock_headers, mock_download, mock_get_blob, moc
 @mock.patch("aou.main.get_or_create_workload", return_value="workload_uuid")
 @mock.patch.object(storage.Bucket, 'get_blob')
 @mock.patch.object(storage.Blob, 'download_as_string')
-@mock.patch("aou.main.get_auth_headers")
-def test_wfl_called_when_sample_upload_completes(mock_headers, mock_download, mock_get_blob, mock_get_workload, mock_update_workload):
+@mock.patch("aou.main.get_wfl_client")
+def test_wfl_called_when_sample_upload_completes(mock_client, mock_download, mock_get_blob, mock_get_workload, mock_update_workload):
     client = mock.create_autospec(storage.Client())
     mock_download.return_value = '{"executor": "http://cromwell.broadinstitute.org", ' \
                                  '"sample_alias": "test_sample", ' \
@@ -3,24 +3,41 @@ the submit_aou_workload cloud function for each file. When all files have been u
 workflow via the workflow launcher (but only if a workflow with that chipwell barcode & analysis version has not
 been run before).
 
-Usage: python upload_test_files.py -b <bucket>
+To load test the pipeline, upload N samples with distinct chipwell barcodes and analysis versions, concurrently,
+arriving at a steady rate, in bursts, or as a Poisson process. The time each sample's upload completed is written
+to the --record file, which collect_submission_times.py matches against the Cromwell workflows started for them.
+Use --destination-dir and --source to upload into a local directory standing in for the bucket, offline.
+
+Usage: python upload_test_files.py -b <bucket> [-n <samples> --arrival poisson --rate 0.5 --record uploads.jsonl]
 """
 
 import argparse
 import json
+import os
 import random
+import shutil
 import sys
 import subprocess
 import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+source_path = "gs://broad-gotc-dev-wfl-ptc-test-inputs/arrays"
+chip_well_barcode = "7991775143_R01C01"
 
-arrays_path = "gs://broad-gotc-dev-wfl-ptc-test-inputs/arrays/HumanExome-12v1-1_A/"
-arrays_metadata_path = "gs://broad-gotc-dev-wfl-ptc-test-inputs/arrays/metadata/HumanExome-12v1-1_A/"
+def get_source_paths(source):
+    return {
+        "arrays": f"{source}/HumanExome-12v1-1_A/",
+        "arrays_metadata": f"{source}/metadata/HumanExome-12v1-1_A/"
+    }
 
-def get_destination_paths(bucket, prefix):
+def get_destination_paths(bucket, prefix, destination_dir=None):
+    root = destination_dir or f"gs://{bucket}"
     return {
-        "arrays": f"gs://{bucket}/{prefix}/arrays/",
-        "arrays_metadata": f"gs://{bucket}/{prefix}/arrays/metadata/",
-        "ptc": f"gs://{bucket}/{prefix}/ptc.json"
+        "arrays": f"{root}/{prefix}/arrays/",
+        "arrays_metadata": f"{root}/{prefix}/arrays/metadata/",
+        "ptc": f"{root}/{prefix}/ptc.json"
     }
 
 def get_ptc_json(bucket, prefix, chip_well_barcode, analysis_version, prod):
@@ -48,18 +65,78 @@ def get_ptc_json(bucket, prefix, chip_well_barcode, analysis_version, prod):
         }]
     }
 
-def main(bucket, prod):
-    chip_well_barcode = "7991775143_R01C01"
-    analysis_version = random.randrange(sys.maxsize)
-    prefix = f"chip_name/{chip_well_barcode}/{analysis_version}"
-    ptc_json = get_ptc_json(bucket, prefix, chip_well_barcode, analysis_version, prod)
-    destination_paths = get_destination_paths(bucket, prefix)
+def copy(source, destination):
+    """Copy SOURCE to DESTINATION with gsutil, or locally when neither is a gs:// URL."""
+    if source.startswith("gs://") or destination.startswith("gs://"):
+        subprocess.run(["gsutil", "-q", "cp", "-r", source, destination], check=True)
+    elif os.path.isdir(source):
+        shutil.copytree(source, os.path.join(destination, os.path.basename(source.rstrip("/"))),
+                        dirs_exist_ok=True)
+    else:
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        shutil.copy(source, destination)
+
+def get_arrival_offsets(samples, arrival, rate, burst_size):
+    """Return the seconds after the start of the run at which each sample should begin uploading,
+    averaging RATE samples per second."""
+    if arrival == "steady":
+        return [i / rate for i in range(samples)]
+    if arrival == "burst":
+        return [(i // burst_size) * burst_size / rate for i in range(samples)]
+    offsets, offset = [], 0.0
+    for _ in range(samples):
+        offsets.append(offset)
+        offset += random.expovariate(rate)
+    return offsets
+
+def upload_sample(bucket, prod, barcode, analysis_version, source, destination_dir):
+    """Upload one sample's files and its ptc.json, returning when the upload completed."""
+    prefix = f"chip_name/{barcode}/{analysis_version}"
+    ptc_json = get_ptc_json(bucket, prefix, barcode, analysis_version, prod)
+    source_paths = get_source_paths(source)
+    destination_paths = get_destination_paths(bucket, prefix, destination_dir)
     with tempfile.TemporaryDirectory() as tmpdirname:
         with open(f'{tmpdirname}/ptc.json', 'w') as f:
             json.dump(ptc_json, f)
-        subprocess.run(["gsutil", "cp", "-r", arrays_path, destination_paths["arrays"]])
-        subprocess.run(["gsutil", "cp", "-r", arrays_metadata_path, destination_paths["arrays_metadata"]])
-        subprocess.run(["gsutil", "cp", f"{tmpdirname}/ptc.json", destination_paths["ptc"]])
+        copy(source_paths["arrays"], destination_paths["arrays"])
+        copy(source_paths["arrays_metadata"], destination_paths["arrays_metadata"])
+        copy(f"{tmpdirname}/ptc.json", destination_paths["ptc"])
+    return {
+        "chip_well_barcode": barcode,
+        "analysis_version_number": analysis_version,
+        "prefix": prefix,
+        "uploaded": time.time()
+    }
+
+def main(bucket, prod, samples=1, arrival="steady", rate=1.0, burst_size=None, concurrency=8,
+         source=source_path, destination_dir=None, record=None):
+    run_id = random.randrange(10 ** 6)
+    offsets = get_arrival_offsets(samples, arrival, rate, burst_size or samples)
+    lock = threading.Lock()
+    out = open(record, "a") if record else None
+
+    def run(i):
+        barcode = chip_well_barcode if samples == 1 else f"{chip_well_barcode}_{run_id}_{i}"
+        result = upload_sample(bucket, prod, barcode, random.randrange(sys.maxsize), source, destination_dir)
+        with lock:
+            print(f"Uploaded {result['prefix']}")
+            if out:
+                out.write(json.dumps(result) + "\n")
+                out.flush()
+        return result
+
+    start = time.time()
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            futures = []
+            for i, offset in enumerate(offsets):
+                time.sleep(max(0.0, start + offset - time.time()))
+                futures.append(executor.submit(run, i))
+            for future in futures:
+                future.result()
+    finally:
+        if out:
+            out.close()
 
 
 if __name__ == '__main__':
@@ -77,5 +154,50 @@ if __name__ == '__main__':
         action="store_true",
         help="Use infrastructure in broad-aou rather than broad-gotc-dev."
     )
+    parser.add_argument(
+        "-n",
+        "--samples",
+        type=int,
+        default=1,
+        help="The number of samples to upload."
+    )
+    parser.add_argument(
+        "--arrival",
+        choices=["steady", "burst", "poisson"],
+        default="steady",
+        help="How sample uploads are spaced in time."
+    )
+    parser.add_argument(
+        "--rate",
+        type=float,
+        default=1.0,
+        help="The mean number of samples to start uploading per second."
+    )
+    parser.add_argument(
+        "--burst-size",
+        type=int,
+        help="The number of samples in each burst. Defaults to all of them."
+    )
+    parser.add_argument(
+        "-j",
+        "--concurrency",
+        type=int,
+        default=8,
+        help="The most samples to upload at once."
+    )
+    parser.add_argument(
+        "--source",
+        default=source_path,
+        help="The directory or gs:// URL holding the sample files."
+    )
+    parser.add_argument(
+        "--destination-dir",
+        help="Upload into this local directory instead of the bucket."
+    )
+    parser.add_argument(
+        "--record",
+        help="Append each sample's upload-complete time to this JSON lines file."
+    )
     args = parser.parse_args()
-    main(args.bucket, args.prod)
+    main(args.bucket, args.prod, args.samples, args.arrival, args.rate, args.burst_size, args.concurrency,
+         args.source, args.destination_dir, args.record)
@@ -28,6 +28,11 @@ else
 fi
 
 gcloud config set project ${GCLOUD_PROJECT}
+
+# Deploy the shared WFL client alongside the function.
+cp -r ../wfl_client .
+trap 'rm -rf wfl_client' EXIT
+
 gcloud functions deploy submit_sg_workload \
     --region ${REGION} \
     --trigger-resource ${TRIGGER_BUCKET_NAME} \
@@ -1,5 +1,9 @@
 import os
+import re
 import requests
+from collections import namedtuple
+from google.cloud import storage
+from wfl_client import Client, MetadataTokenProvider
 
 WFL_URL = os.environ.get('WFL_URL')
 CROMWELL_URL = os.environ.get('CROMWELL_URL')
@@ -12,31 +16,71 @@ assert WORKLOAD_PROJECT is not None, 'WORKLOAD_PROJECT is not set'
 assert OUTPUT_BUCKET is not None, 'OUTPUT_BUCKET is not set'
 
 
-def get_auth_headers():
-    scopes = ','.join([
-        'https://www.googleapis.com/auth/cloud-platform',
-        'https://www.googleapis.com/auth/userinfo.email',
-        'https://www.googleapis.com/auth/userinfo.profile'
-    ])
-    metadata_url = (
-        'http://metadata.google.internal/computeMetadata/v1/'
-        f'instance/service-accounts/default/token?scopes={scopes}'
+_wfl_client = None
+
+
+def get_wfl_client():
+    """Return this instance's WFL client, so that warm invocations reuse
+    its cached token and pooled connections."""
+    global _wfl_client
+    if _wfl_client is None:
+        _wfl_client = Client(wfl_url=WFL_URL,
+                             token_provider=MetadataTokenProvider())
+    return _wfl_client
+
+
+# A route maps object names matching `pattern` to the inputs of
+# `pipeline`.  The pattern splits a name into a `stem` shared by every
+# file of one input set and a `suffix` naming its input in `roles`.
+# Every role is required: an input set is complete, and submitted by
+# the event for its newest file, once a file is present for each role.
+# Add a role only for an input the pipeline declares.
+Route = namedtuple('Route', ['pipeline', 'pattern', 'roles'])
+
+ROUTES = [
+    Route(
+        pipeline='GDCWholeGenomeSomaticSingleSample',
+        pattern=re.compile(r'^(?P<stem>.+?)(?P<suffix>\.bam)$'),
+        roles={'.bam': 'ubam'}
     )
-    metadata_headers = {'Metadata-Flavor': 'Google'}
-    r = requests.get(metadata_url, headers=metadata_headers)
-    r.raise_for_status()
-    access_token = r.json()['access_token']
-    headers = {
-        'Authorization': 'Bearer {}'.format(access_token)
-    }
-    return headers
+]
+
 
+def route_event(object_name):
+    """Return (route, stem, role) for OBJECT_NAME or None."""
+    for route in ROUTES:
+        match = route.pattern.match(object_name)
+        if match:
+            return route, match['stem'], route.roles[match['suffix']]
+    return None
 
-def make_payload(inputs):
+
+def list_blobs(bucket_name, prefix):
+    return storage.Client().list_blobs(bucket_name, prefix=prefix)
+
+
+def gather_inputs(bucket_name, route, stem):
+    """Return the inputs for STEM under ROUTE in BUCKET_NAME from a
+    single prefix listing, with the name of the newest file among them."""
+    inputs = {}
+    newest = None
+    for blob in list_blobs(bucket_name, stem):
+        match = route.pattern.match(blob.name)
+        if not match or match['stem'] != stem:
+            continue
+        role = route.roles[match['suffix']]
+        inputs[role] = f'gs://{bucket_name}/{blob.name}'
+        key = (blob.time_created, blob.name)
+        if newest is None or key > newest:
+            newest = key
+    return inputs, newest and newest[1]
+
+
+def make_payload(inputs, pipeline='GDCWholeGenomeSomaticSingleSample'):
     return {
         'cromwell': CROMWELL_URL,
         'output': OUTPUT_BUCKET,
-        'pipeline': 'GDCWholeGenomeSomaticSingleSample',
+        'pipeline': pipeline,
         'project': WORKLOAD_PROJECT,
         'items': [
             {
@@ -52,22 +96,15 @@ def describe_workload(workload):
     return workflows
 
 
-def post_payload(headers, payload):
+def post_payload(client, payload):
     try:
-        response = requests.post(
-            url=f'{WFL_URL}/api/v1/exec',
-            headers=headers,
-            json=payload
-        )
-        response.raise_for_status()
-        workload = response.json()
+        workload = client.exec_workload(payload)
         return describe_workload(workload)
     except Exception as e:
         print(f'The failed payload: {payload}')
-        try:
-            # noinspection PyUnboundLocalVariable
-            print(f'The failed response: {response.text}')
-        except UnboundLocalError:
+        if isinstance(e, requests.HTTPError) and e.response is not None:
+            print(f'The failed response: {e.response.text}')
+        else:
             print('No response text available')
         raise e
 
@@ -81,12 +118,27 @@ def submit_sg_workload(event, _):
                        the Cloud Storage `object` format described here:
                        https://cloud.google.com/storage/docs/json_api/v1/objects#resource
         _ (google.cloud.functions.Context): Metadata of triggering event.
+
+    Events are routed on object name before any network I/O so that
+    files matching no route are dropped at once.  A route with one
+    role submits each file alone.  Otherwise only the event for the
+    newest file of a complete input set submits it.
     """
-    headers = get_auth_headers()
+    routed = route_event(event['name'])
+    if not routed:
+        return
+    route, stem, role = routed
 
-    input_file = f"gs://{event['bucket']}/{event['name']}"
+    if set(route.roles.values()) == {role}:
+        inputs = {role: f"gs://{event['bucket']}/{event['name']}"}
+    else:
+        inputs, newest = gather_inputs(event['bucket'], route, stem)
+        missing = set(route.roles.values()) - inputs.keys()
+        if missing:
+            print(f'Waiting for {sorted(missing)} of {stem}')
+            return
+        if newest != event['name']:
+            return
 
-    if input_file.endswith('.bam'):
-        print(f'Submitting {input_file}')
-        inputs = {'ubam': input_file}
-        return post_payload(headers, make_payload(inputs))
+    print(f'Submitting {inputs}')
+    return post_payload(get_wfl_client(), make_payload(inputs, route.pipeline))
@@ -61,14 +61,89 @@ def mocked_requests_post(*args, **kwargs):
     return MockResponse('<span>Not found</span>', 404)
 
 
-@mock.patch('sg.main.get_auth_headers')
-@mock.patch('requests.post', side_effect=mocked_requests_post)
-def test_main(mock_post, mock_get_auth_headers):
+def test_route_event():
+    route, stem, role = main.route_event('dir/sample.bam')
+    assert route.pipeline == 'GDCWholeGenomeSomaticSingleSample'
+    assert (stem, role) == ('dir/sample', 'ubam')
+    assert main.route_event('dir/sample.bam.bai') is None
+    assert main.route_event('dir/sample.txt') is None
+
+
+def mock_blob(name, time_created=0):
+    blob = mock.Mock(time_created=time_created)
+    blob.name = name
+    return blob
+
+
+PAIRED_ROUTE = main.Route(
+    pipeline='Paired',
+    pattern=main.re.compile(r'^(?P<stem>.+?)(?P<suffix>\.bam|\.bam\.bai)$'),
+    roles={'.bam': 'bam', '.bam.bai': 'bai'}
+)
+
+
+@mock.patch('sg.main.list_blobs')
+def test_gather_inputs(mock_list_blobs):
+    mock_list_blobs.return_value = [
+        mock_blob('dir/sample.bam', 2),
+        mock_blob('dir/sample.bam.bai', 3),
+        mock_blob('dir/sample2.bam', 4),
+        mock_blob('dir/sample.txt', 5)
+    ]
+    inputs, newest = main.gather_inputs('fake-bucket', PAIRED_ROUTE,
+                                        'dir/sample')
+    mock_list_blobs.assert_called_once_with('fake-bucket', 'dir/sample')
+    assert inputs == {
+        'bam': 'gs://fake-bucket/dir/sample.bam',
+        'bai': 'gs://fake-bucket/dir/sample.bam.bai'
+    }
+    assert newest == 'dir/sample.bam.bai'
+
+
+@mock.patch('sg.main.post_payload', return_value=['uuid1'])
+@mock.patch('sg.main.get_wfl_client')
+@mock.patch('sg.main.list_blobs')
+@mock.patch('sg.main.ROUTES', [PAIRED_ROUTE])
+def test_newest_file_of_complete_set_submits(mock_list_blobs,
+                                             mock_get_wfl_client,
+                                             mock_post_payload):
+    def event(name):
+        return main.submit_sg_workload(
+            {'bucket': 'fake-bucket', 'name': name}, None)
+
+    mock_list_blobs.return_value = [mock_blob('sample.bam', 1)]
+    assert event('sample.bam') is None
+    assert not mock_post_payload.called
+
+    mock_list_blobs.return_value = [mock_blob('sample.bam', 1),
+                                    mock_blob('sample.bam.bai', 2)]
+    assert event('sample.bam') is None
+    assert event('sample.bam.bai') == ['uuid1']
+    assert mock_post_payload.call_count == 1
+
+
+@mock.patch('sg.main.get_wfl_client')
+@mock.patch('sg.main.list_blobs')
+def test_unrouted_events_do_no_io(mock_list_blobs, mock_get_wfl_client):
+    for name in ['something.txt', 'something.bai', 'something.bam.md5']:
+        assert main.submit_sg_workload(
+            {'bucket': 'fake-bucket', 'name': name},
+            None
+        ) is None
+    assert not mock_list_blobs.called
+    assert not mock_get_wfl_client.called
+
+
+@mock.patch.object(main.MetadataTokenProvider, 'headers')
+@mock.patch('sg.main.list_blobs')
+@mock.patch('requests.Session.request', side_effect=mocked_requests_post)
+def test_main(mock_post, mock_list_blobs, mock_get_auth_headers):
     mock_get_auth_headers.return_value = {'Authorization': 'Bearer abcd'}
     assert main.submit_sg_workload(
         {'bucket': 'fake-bucket', 'name': 'something.bam'},
         None
     ) == ['uuid1']
+    assert not mock_list_blobs.called
 
     mock_get_auth_headers.return_value = {}
     with pytest.raises(Exception) as excinfo:
@@ -77,3 +152,6 @@ def test_main(mock_post, mock_get_auth_headers):
             None
         )
     assert '401' in str(excinfo.value)
+
+    inputs = mock_post.call_args[1]['json']['items'][0]['inputs']
+    assert inputs == {'ubam': 'gs://fake-bucket/something.bam'}
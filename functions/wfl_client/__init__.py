@@ -0,0 +1,9 @@
+from .client import (AsyncClient, Client, CredentialsTokenProvider,
+                     MetadataTokenProvider)
+
+__all__ = [
+    'AsyncClient',
+    'Client',
+    'CredentialsTokenProvider',
+    'MetadataTokenProvider'
+]
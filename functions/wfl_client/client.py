@@ -0,0 +1,175 @@
+"""Clients for the WFL and Cromwell APIs shared by the cloud functions
+and the ops scripts.
+
+`Client` blocks and suits the cloud functions.  `AsyncClient` wraps it
+for asyncio, running requests on a bounded thread pool over a shared
+pool of connections, so one process can keep hundreds of requests in
+flight without a dependency beyond `requests`.
+"""
+import asyncio
+import functools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+METADATA_SCOPES = [
+    'https://www.googleapis.com/auth/cloud-platform',
+    'https://www.googleapis.com/auth/userinfo.email',
+    'https://www.googleapis.com/auth/userinfo.profile'
+]
+
+
+class MetadataTokenProvider:
+    """Authorize as the default service account of a Google Cloud
+    instance, caching its access token until shortly before it expires.
+    """
+
+    def __init__(self, scopes=None, leeway=60):
+        self.scopes = scopes or METADATA_SCOPES
+        self.leeway = leeway
+        self.token = None
+        self.expiry = 0
+        self.lock = threading.Lock()
+
+    def refresh(self):
+        metadata_url = (
+            'http://metadata.google.internal/computeMetadata/v1/'
+            'instance/service-accounts/default/token'
+            f'?scopes={",".join(self.scopes)}'
+        )
+        metadata_headers = {'Metadata-Flavor': 'Google'}
+        r = requests.get(metadata_url, headers=metadata_headers)
+        r.raise_for_status()
+        token = r.json()
+        self.token = token['access_token']
+        self.expiry = time.time() + token.get('expires_in', 0) - self.leeway
+
+    def headers(self):
+        with self.lock:
+            if time.time() >= self.expiry:
+                self.refresh()
+            return {'Authorization': f'Bearer {self.token}'}
+
+
+class CredentialsTokenProvider:
+    """Authorize with google.auth `credentials`, such as those of a
+    service account key, refreshing them when they are no longer valid.
+    """
+
+    def __init__(self, credentials):
+        self.credentials = credentials
+        self.lock = threading.Lock()
+
+    def headers(self):
+        with self.lock:
+            if not self.credentials.valid:
+                import google.auth.transport.requests
+                self.credentials.refresh(
+                    google.auth.transport.requests.Request())
+            return {'Authorization': f'Bearer {self.credentials.token}'}
+
+
+class Client:
+    """Call the WFL API at `wfl_url` and the Cromwell API at
+    `cromwell_url` with headers from `token_provider`, reusing at most
+    `max_connections` connections to each host.  Raise
+    `requests.HTTPError` when a request fails.
+    """
+
+    def __init__(self, wfl_url=None, cromwell_url=None, token_provider=None,
+                 max_connections=10):
+        self.wfl_url = wfl_url and wfl_url.rstrip('/')
+        self.cromwell_url = cromwell_url and cromwell_url.rstrip('/')
+        self.token_provider = token_provider
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_maxsize=max_connections)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def request(self, method, url, **kwargs):
+        headers = self.token_provider.headers() if self.token_provider else {}
+        response = self.session.request(method, url=url, headers=headers,
+                                        **kwargs)
+        response.raise_for_status()
+        return response.json()
+
+    def exec_workload(self, payload):
+        """Create and start a workload from `payload`."""
+        return self.request('POST', f'{self.wfl_url}/api/v1/exec',
+                            json=payload)
+
+    def append_to_aou(self, payload):
+        """Add the samples in `payload` to an AllOfUsArrays workload."""
+        return self.request('POST', f'{self.wfl_url}/api/v1/append_to_aou',
+                            json=payload)
+
+    def get_workloads(self, uuid=None, project=None):
+        """Get the workload with `uuid`, or the workloads of `project`."""
+        params = {k: v for k, v in [('uuid', uuid), ('project', project)] if v}
+        return self.request('GET', f'{self.wfl_url}/api/v1/workload',
+                            params=params)
+
+    def get_workflows(self, uuid, status=None, submission=None):
+        """Get the workflows of workload `uuid`, optionally only those
+        with `status` or from `submission`."""
+        params = {k: v for k, v in [('status', status),
+                                    ('submission', submission)] if v}
+        return self.request(
+            'GET', f'{self.wfl_url}/api/v1/workload/{uuid}/workflows',
+            params=params)
+
+    def query_workflows(self, params):
+        """Query Cromwell for workflows matching `params`, a list of
+        single-entry dicts as the Cromwell query API takes them."""
+        return self.request(
+            'POST', f'{self.cromwell_url}/api/workflows/v1/query',
+            json=params)
+
+    def close(self):
+        self.session.close()
+
+
+class AsyncClient:
+    """Awaitable versions of the `Client` methods keeping at most
+    `max_in_flight` requests in flight over as many connections.
+    """
+
+    def __init__(self, wfl_url=None, cromwell_url=None, token_provider=None,
+                 max_in_flight=100):
+        self.client = Client(wfl_url, cromwell_url, token_provider,
+                             max_connections=max_in_flight)
+        self.executor = ThreadPoolExecutor(max_workers=max_in_flight)
+
+    async def call(self, method, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.executor, functools.partial(method, *args, **kwargs))
+
+    async def exec_workload(self, payload):
+        return await self.call(self.client.exec_workload, payload)
+
+    async def append_to_aou(self, payload):
+        return await self.call(self.client.append_to_aou, payload)
+
+    async def get_workloads(self, uuid=None, project=None):
+        return await self.call(self.client.get_workloads, uuid, project)
+
+    async def get_workflows(self, uuid, status=None, submission=None):
+        return await self.call(self.client.get_workflows, uuid, status,
+                               submission)
+
+    async def query_workflows(self, params):
+        return await self.call(self.client.query_workflows, params)
+
+    def close(self):
+        self.executor.shutdown()
+        self.client.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *_):
+        self.close()
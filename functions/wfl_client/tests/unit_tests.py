@@ -0,0 +1,100 @@
+import asyncio
+import json
+import threading
+import time
+import mock
+import pytest
+import requests
+from wfl_client import (AsyncClient, Client, CredentialsTokenProvider,
+                        MetadataTokenProvider)
+
+
+class MockResponse:
+    def __init__(self, body, status_code=200):
+        self.text = json.dumps(body)
+        self.status_code = status_code
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(self.status_code, response=self)
+
+    def json(self):
+        return json.loads(self.text)
+
+
+@mock.patch('requests.get')
+def test_metadata_token_provider_caches_token(mock_get):
+    mock_get.return_value = MockResponse(
+        {'access_token': 'abcd', 'expires_in': 3600})
+    provider = MetadataTokenProvider()
+    assert provider.headers() == {'Authorization': 'Bearer abcd'}
+    assert provider.headers() == {'Authorization': 'Bearer abcd'}
+    assert mock_get.call_count == 1
+
+    provider.expiry = time.time()
+    mock_get.return_value = MockResponse(
+        {'access_token': 'efgh', 'expires_in': 3600})
+    assert provider.headers() == {'Authorization': 'Bearer efgh'}
+    assert mock_get.call_count == 2
+
+
+def test_credentials_token_provider():
+    credentials = mock.Mock(valid=True, token='abcd')
+    provider = CredentialsTokenProvider(credentials)
+    assert provider.headers() == {'Authorization': 'Bearer abcd'}
+    assert not credentials.refresh.called
+
+
+@mock.patch('requests.Session.request')
+def test_client_requests(mock_request):
+    mock_request.return_value = MockResponse({'uuid': 'foo'})
+    provider = mock.Mock()
+    provider.headers.return_value = {'Authorization': 'Bearer abcd'}
+    client = Client('https://wfl/', 'https://cromwell/', provider)
+
+    assert client.exec_workload({'pipeline': 'x'}) == {'uuid': 'foo'}
+    mock_request.assert_called_with(
+        'POST', url='https://wfl/api/v1/exec',
+        headers={'Authorization': 'Bearer abcd'}, json={'pipeline': 'x'})
+
+    client.get_workflows('foo', status='Running')
+    mock_request.assert_called_with(
+        'GET', url='https://wfl/api/v1/workload/foo/workflows',
+        headers={'Authorization': 'Bearer abcd'},
+        params={'status': 'Running'})
+
+    client.query_workflows([{'name': 'Arrays'}])
+    mock_request.assert_called_with(
+        'POST', url='https://cromwell/api/workflows/v1/query',
+        headers={'Authorization': 'Bearer abcd'}, json=[{'name': 'Arrays'}])
+
+    mock_request.return_value = MockResponse({}, 401)
+    with pytest.raises(requests.HTTPError):
+        client.append_to_aou({'uuid': 'foo'})
+
+
+@mock.patch('requests.Session.request')
+def test_async_client_limits_requests_in_flight(mock_request):
+    lock = threading.Lock()
+    in_flight = []
+    peak = []
+
+    def request(*args, **kwargs):
+        with lock:
+            in_flight.append(1)
+            peak.append(len(in_flight))
+        time.sleep(0.01)
+        with lock:
+            in_flight.pop()
+        return MockResponse({'uuid': kwargs['params']['uuid']})
+
+    mock_request.side_effect = request
+
+    async def get_all():
+        async with AsyncClient('https://wfl', max_in_flight=4) as client:
+            return await asyncio.gather(
+                *[client.get_workloads(uuid=str(i)) for i in range(20)])
+
+    results = asyncio.run(get_all())
+    assert [r['uuid'] for r in results] == [str(i) for i in range(20)]
+    assert 1 < max(peak) <= 4
@@ -6,14 +6,30 @@ that has a lifecycle policy for deletion. The following files are excluded from
 
 import argparse
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 import json
-import requests
+import os
+import sys
 from google.cloud import storage
 from google.oauth2 import service_account
 import google.auth.transport.requests
 
+try:
+    import pyarrow
+    import pyarrow.compute as pc
+except ImportError:
+    pyarrow = None
+
+OPS_DIR = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.append(OPS_DIR)
+sys.path.append(os.path.join(os.path.dirname(OPS_DIR), 'functions'))
+from util.misc import add_profile_arguments, phase, profiled, start_profiling_if_requested
+from wfl_client import Client, CredentialsTokenProvider
+
 MERCURY_ENVS = ['dev', 'staging', 'prod']
 CROMWELL_SCOPES = ['email', 'openid', 'profile']
+DELETE_BATCH_SIZE = 100
+MOVE_WORKERS = 16
 STORAGE_SCOPES = ['https://www.googleapis.com/auth/devstorage.full_control',
                   'https://www.googleapis.com/auth/devstorage.read_only',
                   'https://www.googleapis.com/auth/devstorage.read_write']
@@ -28,14 +44,52 @@ def get_credentials(service_account_key_path, scopes):
         credentials.refresh(google.auth.transport.requests.Request())
     return credentials
 
-def move_blob(client, bucket_name, blob_name, destination_bucket_name):
-    """Copy a blob from bucket_name to destination_bucket_name, and delete it from bucket_name.
+def list_blobs(client, bucket_name, checksums=None):
+    """List the blobs in bucket_name, recording the crc32c and size of each in checksums
+    unless it is None."""
+    blobs = client.list_blobs(bucket_name, prefix=None)
+    if checksums is None:
+        yield from blobs
+        return
+    for blob in blobs:
+        checksums[blob.name] = (blob.crc32c, blob.size)
+        yield blob
+
+def move_blobs(client, bucket_name, blob_names, destination_bucket_name, checksums):
+    """Copy blob_names from bucket_name to destination_bucket_name in parallel, and delete from
+    bucket_name, in batch requests, only the blobs whose copy has the crc32c and size listed in checksums.
+    Return the names of the blobs moved, of those whose copy failed or did not match, and of those
+    in a delete batch that failed.
     https://cloud.google.com/storage/docs/copying-renaming-moving-objects#copy"""
     source_bucket = client.bucket(bucket_name)
-    source_blob = source_bucket.blob(blob_name)
     destination_bucket = client.bucket(destination_bucket_name)
-    blob_copy = source_bucket.copy_blob(source_blob, destination_bucket)
-    source_blob.delete()
+
+    @profiled
+    def copy(blob_name):
+        try:
+            blob_copy = source_bucket.copy_blob(source_bucket.blob(blob_name), destination_bucket)
+        except Exception as e:
+            print(f"Failed to copy {blob_name}: {e}")
+            return blob_name, False
+        return blob_name, (blob_copy.crc32c, blob_copy.size) == checksums.get(blob_name)
+
+    verified, mismatched = [], []
+    with ThreadPoolExecutor(max_workers=MOVE_WORKERS) as executor:
+        for blob_name, matches in executor.map(copy, blob_names):
+            (verified if matches else mismatched).append(blob_name)
+    moved, undeleted = [], []
+    for i in range(0, len(verified), DELETE_BATCH_SIZE):
+        batch = verified[i:i + DELETE_BATCH_SIZE]
+        try:
+            with client.batch():
+                for blob_name in batch:
+                    source_bucket.delete_blob(blob_name)
+        except Exception as e:
+            print(f"Failed to delete a batch of {len(batch)} files: {e}")
+            undeleted.extend(batch)
+        else:
+            moved.extend(batch)
+    return moved, mismatched, undeleted
 
 def get_latest_analysis_inputs(files):
     """Get input files for the latest analysis version number of each chip_well_barcode."""
@@ -48,27 +102,25 @@ def get_latest_analysis_inputs(files):
 
 def check_active_workflows(cromwell_url, service_account_key_path):
     """Query Cromwell for submitted or running Arrays workflows."""
-    query_url = f'{cromwell_url}/api/workflows/v1/query'
     params = [{"name": "Arrays"}, {"status": "Submitted"}, {"status": "Running"},
               {"additionalQueryResultFields": "labels"}]
-    credentials = get_credentials(service_account_key_path, scopes=CROMWELL_SCOPES)
-    headers = {'Authorization': f'Bearer {credentials.token}'}
-    workflows = requests.post(query_url, headers=headers, json=params)
-    return workflows.json().get('results')
+    credentials = service_account.Credentials.from_service_account_file(service_account_key_path,
+                                                                        scopes=CROMWELL_SCOPES)
+    cromwell = Client(cromwell_url=cromwell_url, token_provider=CredentialsTokenProvider(credentials))
+    return cromwell.query_workflows(params).get('results')
 
-def get_active_analysis_inputs(files, cromwell_url, service_account_key_path):
-    """Get input files that are currently in use by an Arrays workflow in Cromwell."""
+def get_active_analysis_inputs(files, active_workflows):
+    """Get input files that are currently in use by one of the active_workflows."""
     active_files = []
-    active_workflows = check_active_workflows(cromwell_url, service_account_key_path)
     for wf in active_workflows:
         labels = wf.get('labels')
         if labels:
             wf_chip_well_barcode = labels.get('chip_well_barcode')
             wf_analysis_version_number = labels.get('analysis_version_number')
             for chip_name, chip_well_barcode in files.items():
-                if chip_well_barcode[wf_chip_well_barcode][wf_analysis_version_number]:
-                  _files = chip_well_barcode[wf_chip_well_barcode][wf_analysis_version_number]
-                  active_files.extend(_files)
+                _files = chip_well_barcode.get(wf_chip_well_barcode, {}).get(wf_analysis_version_number)
+                if _files:
+                    active_files.extend(_files)
     return active_files
 
 def get_files_to_keep(env):
@@ -76,64 +128,172 @@ def get_files_to_keep(env):
         files = json.load(f)
     return files.get(env, [])
 
-def main(env, service_account_key_path, apply=False):
+def get_env_config(env):
+    """Get the Cromwell and storage configuration for env. The dev and staging
+    environments share an input bucket and a Cromwell. Blobs in the input bucket
+    without a Mercury environment prefix belong to its unprefixed_env."""
     if env == "prod":
-        cromwell_url = "https://cromwell-aou.gotc-prod.broadinstitute.org"
-        google_project = "broad-aou-storage"
-        bucket_name = "broad-aou-arrays-input"
-        cleanup_bucket = "broad-aou-arrays-trash"
-    else:
-        cromwell_url = "https://cromwell-gotc-auth.gotc-dev.broadinstitute.org"
-        google_project = "broad-gotc-dev-storage"
-        bucket_name = "dev-aou-arrays-input"
-        cleanup_bucket = "dev-aou-arrays-trash"
-
-    credentials = get_credentials(service_account_key_path, scopes=STORAGE_SCOPES)
-    client = storage.Client(project=google_project, credentials=credentials)
-    file_blobs = client.list_blobs(bucket_name, prefix=None)
-    file_names = []
-    files = defaultdict(lambda: defaultdict(lambda: defaultdict(list)))
-    mercury_env = None
-    for blob in file_blobs:
+        return {"cromwell_url": "https://cromwell-aou.gotc-prod.broadinstitute.org",
+                "google_project": "broad-aou-storage",
+                "bucket_name": "broad-aou-arrays-input",
+                "cleanup_bucket": "broad-aou-arrays-trash",
+                "unprefixed_env": "prod"}
+    return {"cromwell_url": "https://cromwell-gotc-auth.gotc-dev.broadinstitute.org",
+            "google_project": "broad-gotc-dev-storage",
+            "bucket_name": "dev-aou-arrays-input",
+            "cleanup_bucket": "dev-aou-arrays-trash",
+            "unprefixed_env": "dev"}
+
+def list_input_files(blobs, envs, unprefixed_env):
+    """Walk the blobs of a bucket once, partitioning blob names by Mercury environment prefix.
+    Blobs without an environment prefix are assigned to unprefixed_env."""
+    files = {env: defaultdict(lambda: defaultdict(lambda: defaultdict(list))) for env in envs}
+    file_names = {env: [] for env in envs}
+    for blob in blobs:
         if not blob.name.endswith('/'):
             segments = blob.name.split('/')
             if segments[0] in MERCURY_ENVS:
                 mercury_env, chip_name, chip_well_barcode, analysis_version_number, file_name = segments[:5]
             else:
+                mercury_env = unprefixed_env
                 chip_name, chip_well_barcode, analysis_version_number, file_name = segments[:4]
-            if not mercury_env or mercury_env == env:
-                files[chip_name][chip_well_barcode][analysis_version_number].append(blob.name)
-                file_names.append(blob.name)
+            if mercury_env in files:
+                files[mercury_env][chip_name][chip_well_barcode][analysis_version_number].append(blob.name)
+                file_names[mercury_env].append(blob.name)
+    return files, file_names
+
+def list_input_names(blobs):
+    """Collect the names of the blobs of a bucket without parsing them."""
+    return [blob.name for blob in blobs]
+
+def plan_cleanup_columnar(envs, names, unprefixed_env, active_workflows):
+    """Plan the cleanup of every environment in envs from the blob names of their shared
+    bucket with vectorized pyarrow kernels, the same as list_input_files and plan_cleanup would."""
+    names = pyarrow.array(names, type=pyarrow.string())
+    names = names.filter(pc.invert(pc.ends_with(names, '/')))
+    segments = pc.split_pattern(names, '/', max_splits=4)
+    prefixed = pc.is_in(pc.list_element(segments, 0), value_set=pyarrow.array(MERCURY_ENVS))
+    complete = pc.greater_equal(pc.list_value_length(segments), pc.if_else(prefixed, 5, 4))
+    names, segments, prefixed = names.filter(complete), segments.filter(complete), prefixed.filter(complete)
+
+    def segment(prefixed_index):
+        return pc.if_else(prefixed,
+                          pc.list_element(segments, prefixed_index),
+                          pc.list_element(segments, prefixed_index - 1))
 
+    env = pc.if_else(prefixed, pc.list_element(segments, 0), unprefixed_env)
+    chip, barcode, version = segment(1), segment(2), segment(3)
+    in_envs = pc.is_in(env, value_set=pyarrow.array(envs))
+    names, env, chip, barcode, version = [column.filter(in_envs) for column in [names, env, chip, barcode, version]]
+
+    sample = pc.binary_join_element_wise(env, chip, barcode, '/')
+    versions = pyarrow.table({'sample': sample, 'version': pc.cast(version, pyarrow.int64())})
+    latest_versions = versions.group_by('sample').aggregate([('version', 'max')])
+    latest = pc.is_in(pc.binary_join_element_wise(sample, pc.cast(versions['version'], pyarrow.string()), '/'),
+                      value_set=pc.binary_join_element_wise(latest_versions['sample'],
+                                                            pc.cast(latest_versions['version_max'],
+                                                                    pyarrow.string()), '/'))
+    active_keys = [f"{wf['labels'].get('chip_well_barcode')}/{wf['labels'].get('analysis_version_number')}"
+                   for wf in active_workflows if wf.get('labels')]
+    active = pc.is_in(pc.binary_join_element_wise(barcode, version, '/'),
+                      value_set=pyarrow.array(active_keys, type=pyarrow.string()))
+
+    plans = {}
+    for each in envs:
+        in_env = pc.equal(env, each)
+        keep = pc.or_(pc.or_(latest, active),
+                      pc.is_in(names, value_set=pyarrow.array(get_files_to_keep(each), type=pyarrow.string())))
+        plans[each] = (names.filter(pc.and_(in_env, pc.invert(keep))).to_pylist(),
+                       names.filter(pc.and_(in_env, active)).to_pylist())
+    return plans
+
+def plan_cleanup(env, files, file_names, active_workflows):
+    """Return the files of env to move and the files kept because they are in use."""
     keep_files = get_files_to_keep(env)
     latest_analysis_files = get_latest_analysis_inputs(files)
-    active_files = get_active_analysis_inputs(files, cromwell_url, service_account_key_path)
+    active_files = get_active_analysis_inputs(files, active_workflows)
     keep_files.extend(latest_analysis_files)
     keep_files.extend(active_files)
 
-    move_files = [f for f in file_names if f not in set(keep_files)]
-    print(f"The following files will be moved to {cleanup_bucket} and deleted after 30 days:")
-    for file in move_files:
-        print(file)
-        if apply:
-            move_blob(client, bucket_name, file, cleanup_bucket)
+    keep_files = set(keep_files)
+    move_files = [f for f in file_names if f not in keep_files]
+    return move_files, active_files
 
-    if active_files:
-        print(f"The following files are currently in use by Cromwell and will NOT be deleted: {active_files}")
+def main(envs, service_account_key_path, apply=False, columnar=False):
+    """Clean up every environment in envs, listing each input bucket and
+    querying each Cromwell only once for all of the environments sharing it.
+    Plan with pyarrow when columnar is set."""
+    if columnar and pyarrow is None:
+        raise ImportError("The columnar planning path requires pyarrow: pip install pyarrow")
+    groups = defaultdict(list)
+    for env in dict.fromkeys(envs):
+        groups[tuple(get_env_config(env).items())].append(env)
+
+    for config, group_envs in groups.items():
+        config = dict(config)
+        bucket_name = config["bucket_name"]
+        cleanup_bucket = config["cleanup_bucket"]
+        credentials = get_credentials(service_account_key_path, scopes=STORAGE_SCOPES)
+        client = storage.Client(project=config["google_project"], credentials=credentials)
+        checksums = {} if apply else None
+        with phase("listing"):
+            blobs = list_blobs(client, bucket_name, checksums)
+            if columnar:
+                names = list_input_names(blobs)
+            else:
+                files, file_names = list_input_files(blobs, group_envs, config["unprefixed_env"])
+        with phase("cromwell query"):
+            active_workflows = check_active_workflows(config["cromwell_url"], service_account_key_path)
+        with phase("planning"):
+            if columnar:
+                plans = plan_cleanup_columnar(group_envs, names, config["unprefixed_env"], active_workflows)
+            else:
+                plans = {env: plan_cleanup(env, files[env], file_names[env], active_workflows)
+                         for env in group_envs}
+            if apply:
+                checksums = {name: checksums[name] for move_files, _ in plans.values() for name in move_files}
+
+        for env in group_envs:
+            move_files, active_files = plans[env]
+            print(f"The following {env} files will be moved to {cleanup_bucket} and deleted after 30 days:")
+            for file in move_files:
+                print(file)
+            if apply:
+                with phase("moving"):
+                    moved, mismatched, undeleted = move_blobs(client, bucket_name, move_files, cleanup_bucket,
+                                                              checksums)
+                print(f"Moved {len(moved)} {env} files to {cleanup_bucket}")
+                if mismatched:
+                    print(f"The following {env} files were NOT deleted because their copy to {cleanup_bucket} "
+                          f"failed or its crc32c or size did not match: {mismatched}")
+                if undeleted:
+                    print(f"The following {env} files were copied to {cleanup_bucket} but may NOT have been "
+                          f"deleted because their delete batch failed: {undeleted}")
+
+            if active_files:
+                print(f"The following {env} files are currently in use by Cromwell and will NOT be deleted: {active_files}")
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Clean up outdated AOU input files.",
-                                     usage="%(prog)s [-h] [ENV SERVICE_ACCOUNT_KEY_PATH] [...]")
+                                     usage="%(prog)s [-h] [ENV [ENV ...] SERVICE_ACCOUNT_KEY_PATH] [...]")
     parser.add_argument("env",
                         metavar="env",
+                        nargs="+",
                         choices=["dev", "staging", "prod"],
-                        help="Which environment's input files to clean up. Options: [%(choices)s]")
+                        help="Which environments' input files to clean up. Environments that share an input bucket "
+                             "are cleaned up from a single listing. Options: [%(choices)s]")
     parser.add_argument("service_account_key_path",
                         help="A service account with access to the buckets and to Cromwell. The staging 'env' shares"
                              "the same input bucket as dev and uses the dev service account.")
     parser.add_argument("--apply",
                         action="store_true",
                         help="Apply the changes.")
+    parser.add_argument("--columnar",
+                        action="store_true",
+                        help="Parse blob names and plan the cleanup in bulk with pyarrow, which must be installed. "
+                             "Compare the CPU time of each phase with --profile.")
+    add_profile_arguments(parser)
     args = parser.parse_args()
-    main(args.env, args.service_account_key_path, args.apply)
+    start_profiling_if_requested(args)
+    main(args.env, args.service_account_key_path, args.apply, args.columnar)
@@ -7,10 +7,12 @@ usage: python3 cli.py -h
 import argparse
 import re
 
-from dataclasses import dataclass
-from os.path     import dirname, realpath
-from typing      import Callable, Dict, List
-from util.misc   import error, info, shell, success, warn
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses        import dataclass
+from os.path            import dirname, realpath
+from typing             import Callable, Dict, List
+from util.misc          import add_profile_arguments, error, info, phase, profiled, shell, shell_concurrently, \
+                               start_profiling_if_requested, success, warn
 
 @dataclass
 class WflInstanceConfig:
@@ -20,6 +22,8 @@ class WflInstanceConfig:
     version: str = None
     wfl_root_folder: str = f"{dirname(dirname(realpath(__file__)))}"
     current_changelog: str = None
+    profile: bool = False
+    profile_dump: str = None
 
 
 def read_version(config: WflInstanceConfig) -> None:
@@ -41,11 +45,13 @@ def exit_if_dry_run(config: WflInstanceConfig) -> None:
 def publish_docker_images(config: WflInstanceConfig) -> None:
     """Publish latest docker images for the stored version."""
     info(f"=>  Publishing Docker images for version {config.version}")
+    commands = {}
     for module in ["api", "ui"]:
         image = f"broadinstitute/workflow-launcher-{module}"
         # re-tag the image in case the version is being overwritten.
-        shell(f"docker tag {image}:latest {image}:{config.version}")
-        shell(f"docker push {image}:{config.version}")
+        commands[module] = (f"docker tag {image}:latest {image}:{config.version} && "
+                            f"docker push {image}:{config.version}")
+    shell_concurrently(commands)
     success("Published Docker images")
 
 
@@ -97,22 +103,49 @@ def write_changelog(config: WflInstanceConfig) -> None:
     success(f"Changelog is successfully written to {changelog_location}")
 
 
-command_mapping: Dict[str, List[Callable[[WflInstanceConfig], None]]] = {
-    "changelog": [
-        read_version,
-        get_git_commits_since_last_tag,
-        exit_if_dry_run,
-        write_changelog
-    ],
-    "tag-and-push-images": [
-        read_version,
-        exit_if_dry_run,
-        make_git_tag,
-        publish_docker_images
-    ]
+Step = Callable[[WflInstanceConfig], None]
+
+# Map each command to its steps and the steps each one must wait for.
+command_mapping: Dict[str, Dict[Step, List[Step]]] = {
+    "changelog": {
+        read_version: [],
+        get_git_commits_since_last_tag: [],
+        exit_if_dry_run: [read_version, get_git_commits_since_last_tag],
+        write_changelog: [exit_if_dry_run]
+    },
+    "tag-and-push-images": {
+        read_version: [],
+        exit_if_dry_run: [read_version],
+        make_git_tag: [exit_if_dry_run],
+        publish_docker_images: [exit_if_dry_run]
+    }
 }
 
 
+@profiled
+def _run_step(step: Step, config: WflInstanceConfig) -> None:
+    with phase(step.__name__):
+        step(config)
+
+
+def run_steps(steps: Dict[Step, List[Step]], config: WflInstanceConfig) -> None:
+    """Run each of STEPS once all the steps it waits for have finished,
+    running steps that do not depend on each other concurrently."""
+    pending, running, done = dict(steps), {}, set()
+    with ThreadPoolExecutor() as executor:
+        while pending or running:
+            for step, prerequisites in list(pending.items()):
+                if done.issuperset(prerequisites):
+                    running[executor.submit(_run_step, step, config)] = step
+                    del pending[step]
+            if not running:
+                raise ValueError(f"Steps can never run: {[step.__name__ for step in pending]}")
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                future.result()
+                done.add(running.pop(future))
+
+
 def cli() -> WflInstanceConfig:
     """Configure the arguments, help text, and parsing."""
     parser = argparse.ArgumentParser(description="CLI for generating release changelog of WFL",
@@ -125,16 +158,17 @@ def cli() -> WflInstanceConfig:
                         help="exit before COMMAND makes any remote changes")
     parser.add_argument("-v", "--version",
                         help="specify the version to use instead of the 'version' file")
+    add_profile_arguments(parser)
 
     return WflInstanceConfig(**vars(parser.parse_args()))
 
 
 def main() -> int:
-    """Call `cli` and run each function in the command mapping in order."""
+    """Call `cli` and run the steps of the command mapping in dependency order."""
     config = cli()
+    start_profiling_if_requested(config)
     try:
-        for func in command_mapping[config.command]:
-            func(config)
+        run_steps(command_mapping[config.command], config)
         return 0
     except Exception as err:
         error(str(err))
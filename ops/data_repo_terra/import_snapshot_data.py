@@ -1,13 +1,26 @@
 import argparse
 import csv
+from collections import Counter
 import io
+import os
+import queue
 import requests
+import sys
+import threading
 import uuid
 import google.auth
 import google.auth.transport.requests
 from google.cloud import bigquery
 from google.oauth2 import service_account
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from util.misc import add_profile_arguments, phase, profiled, start_profiling_if_requested
+
+QUEUE_DEPTH = 8
+ROW_BATCH_SIZE = 1000
+CHUNK_SIZE = 1024 * 1024
+_DONE = object()
+
 
 def get_service_account_credentials(service_account_path, scopes):
     credentials = service_account.Credentials.from_service_account_file(service_account_path, scopes=scopes)
@@ -26,50 +39,109 @@ def get_snapshot_data(google_project, datarepo_snapshot, service_account_path):
     query_job = client.query(query)
     return query_job.result()
 
-def format_data_as_tsv(tsv_file, snapshot_rows, data_table):
-    """ Write BigQuery results into a TSV file for importing to Terra.
+@profiled
+def _produce(items, pipe, name):
+    """Put each of items on pipe followed by _DONE, or by the exception that stopped them,
+    timing the work in this thread as the phase name."""
+    try:
+        with phase(name):
+            for item in items:
+                pipe.put(item)
+        pipe.put(_DONE)
+    except Exception as e:
+        pipe.put(e)
+
+def _consume(pipe):
+    while True:
+        item = pipe.get()
+        if item is _DONE:
+            return
+        if isinstance(item, Exception):
+            raise item
+        yield item
+
+def pipeline(items, name, depth=QUEUE_DEPTH):
+    """Iterate items in another thread, timed as the phase name, buffering at most depth
+    of them ahead of the consumer."""
+    pipe = queue.Queue(maxsize=depth)
+    threading.Thread(target=_produce, args=(items, pipe, name), daemon=True).start()
+    return _consume(pipe)
+
+def batch_rows(snapshot_rows, size=ROW_BATCH_SIZE):
+    """Group BigQuery results into lists of at most size rows."""
+    batch = []
+    for row in snapshot_rows:
+        batch.append(row)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def format_data_as_tsv(row_batches, data_table, entities):
+    """ Encode batches of BigQuery results as chunks of a TSV file for importing to Terra,
+    printing the entity of each row and counting it in entities, a Counter.
     The first row header must follow the format 'entity:{data_table}_id'.
     For example, 'entity:sample_id' will upload the tsv data into a "sample" table in
     the workspace (or create one if it does not exist). If the table already contains
     a sample with that id, it will get overwritten."""
-    entities = []
-    with open(tsv_file, 'w') as f:
-        headers = None
-        writer = csv.writer(f, delimiter='\t')
-        for row in snapshot_rows:
+    f = io.StringIO()
+    writer = csv.writer(f, delimiter='\t')
+    headers = None
+    for rows in row_batches:
+        for row in rows:
             if not headers:
-                keys = list(row.keys())
-                keys[0] = f'entity:{data_table}_id'
-                writer.writerow(keys)
+                headers = list(row.keys())
+                headers[0] = f'entity:{data_table}_id'
+                writer.writerow(headers)
             writer.writerow(row.values())
-            entities.append({'entity_name': data_table, "entity_id": row[0]})
-    return entities
+            print({'entity_name': data_table, "entity_id": row[0]})
+            entities[data_table] += 1
+        if f.tell() >= CHUNK_SIZE:
+            yield f.getvalue().encode()
+            f.seek(0)
+            f.truncate()
+    if f.tell():
+        yield f.getvalue().encode()
 
-def upload_to_terra(terra_url, terra_workspace, tsv_file, service_account_path):
-    """Upload a TSV file containing sample inputs to a terra workspace. The service
-    account must have owner permissions on the workspace."""
+def upload_to_terra(terra_url, terra_workspace, tsv_chunks, service_account_path):
+    """Upload TSV chunks containing sample inputs to a terra workspace as they arrive,
+    streaming them in a chunked multipart request. The service account must have
+    owner permissions on the workspace."""
     #TODO: Find out what the file size/upload limitations are
     import_url = f'{terra_url}/api/workspaces/{terra_workspace}/flexibleImportEntities'
     scopes = ['email', 'openid', 'profile']
     credentials = get_service_account_credentials(service_account_path, scopes)
-    headers = {'Authorization': f'Bearer {credentials.token}'}
-    with open (tsv_file, 'rb') as f:
-        contents = f.read()
-    response = requests.post(import_url,
-                             headers=headers,
-                             files={'entities': io.BytesIO(contents),
-                                    'type': 'text/tab-separated-values'})
+    boundary = uuid.uuid4().hex
+    headers = {'Authorization': f'Bearer {credentials.token}',
+               'Content-Type': f'multipart/form-data; boundary={boundary}'}
+
+    def body():
+        yield (f'--{boundary}\r\n'
+               'Content-Disposition: form-data; name="entities"; filename="entities"\r\n\r\n').encode()
+        yield from tsv_chunks
+        yield (f'\r\n--{boundary}\r\n'
+               'Content-Disposition: form-data; name="type"; filename="type"\r\n\r\n'
+               f'text/tab-separated-values\r\n--{boundary}--\r\n').encode()
+
+    response = requests.post(import_url, headers=headers, data=body())
     response.raise_for_status()
     return response
 
 def main(datarepo_snapshot, terra_url, terra_workspace, terra_data_table, service_account_path):
-    tsv_file = f'{uuid.uuid4()}_samples.tsv'
-    snapshot_rows = get_snapshot_data('broad-jade-dev-data', datarepo_snapshot, service_account_path)
-    entities = format_data_as_tsv(tsv_file, snapshot_rows, terra_data_table)
-    upload_to_terra(terra_url, terra_workspace, tsv_file, service_account_path)
-    print(f'The following samples have been uploaded to {terra_workspace}:')
-    for sample in entities:
-        print(sample)
+    """Stream the snapshot rows through the TSV encoder into the upload, so that reading
+    from BigQuery overlaps with uploading to Terra and memory is bounded by the queues.
+    Each stage is its own --profile phase timed in its own thread, so their wall times
+    overlap and include time spent waiting on the queues."""
+    entities = Counter()
+    with phase("bigquery query"):
+        snapshot_rows = get_snapshot_data('broad-jade-dev-data', datarepo_snapshot, service_account_path)
+    print(f'Uploading the following samples to {terra_workspace}:')
+    row_batches = pipeline(batch_rows(snapshot_rows), "bigquery export")
+    tsv_chunks = pipeline(format_data_as_tsv(row_batches, terra_data_table, entities), "tsv encoding")
+    with phase("terra upload"):
+        upload_to_terra(terra_url, terra_workspace, tsv_chunks, service_account_path)
+    print(f'{entities[terra_data_table]} samples have been uploaded to {terra_workspace}')
 
 
 if __name__ == '__main__':
@@ -89,5 +161,7 @@ if __name__ == '__main__':
                         help="The Terra workspace data table that will contain the snapshot data.")
     parser.add_argument("service_account_path",
                         help="A service account with access to both the Data Repo snapshot and the Terra workspace.")
+    add_profile_arguments(parser)
     args = parser.parse_args()
+    start_profiling_if_requested(args)
     main(args.datarepo_snapshot, args.terra_url, args.terra_workspace, args.terra_data_table, args.service_account_path)
@@ -2,10 +2,20 @@
 Console and shell utilities shared among ops scripts.
 """
 
+import atexit
+import cProfile
+import functools
+import os
+import pstats
+import resource
+import signal
 import subprocess
 import sys
+import threading
+import time
+from contextlib import contextmanager
 from enum import Enum
-from typing import Optional
+from typing import Dict, List, Optional
 
 
 class AvailableColors(Enum):
@@ -69,3 +79,181 @@ def shell_unchecked(command: str, quiet: bool = False, timeout: Optional[float]
         return subprocess.check_output(command, shell=True, timeout=timeout, encoding="utf-8").strip()
     except subprocess.CalledProcessError as err:
         return err.output.strip()
+
+
+_print_lock = threading.Lock()
+
+
+def _kill_process_group(pid: int):
+    """Kill the process group PID, which may have exited already."""
+    try:
+        os.killpg(pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+
+def _run_prefixed(label: str, command: str, timeout: Optional[float], cwd: Optional[str],
+                  outputs: Dict[str, str], failures: List[str]):
+    """Run COMMAND streaming its output prefixed by LABEL, killing it after TIMEOUT seconds.
+    Record LABEL in FAILURES when COMMAND fails or cannot be run or read."""
+    prefix = _apply_color("gray", f"[{label}]")
+    process, timer, lines = None, None, []
+    try:
+        process = subprocess.Popen(command, shell=True, cwd=cwd, encoding="utf-8", errors="replace",
+                                   stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                   start_new_session=True)
+        if timeout:
+            timer = threading.Timer(timeout, _kill_process_group, [process.pid])
+            timer.start()
+        for line in process.stdout:
+            lines.append(line)
+            with _print_lock:
+                print(f"{prefix} {line}", end="", flush=True)
+        returncode = process.wait()
+    except Exception as err:
+        with _print_lock:
+            print(f"{prefix} {err}", flush=True)
+        if process:
+            _kill_process_group(process.pid)
+            process.wait()
+        returncode = None
+    finally:
+        if timer:
+            timer.cancel()
+    outputs[label] = "".join(lines).strip()
+    if returncode != 0:
+        failures.append(label)
+
+
+def shell_concurrently(commands: Dict[str, str], quiet: bool = False,
+                       timeout: Optional[float] = None, cwd: Optional[str] = None) -> Dict[str, str]:
+    """Run COMMANDS, a map of label to command, in parallel subprocesses.
+    Stream output prefixed by label and return a map of label to output.
+    Kill any command still running after TIMEOUT seconds, and raise when any fails."""
+    outputs, failures = {}, []
+    threads = []
+    for label, command in commands.items():
+        if not quiet:
+            info(f"Running [{label}]: {command}")
+        thread = threading.Thread(target=profiled(_run_prefixed),
+                                  args=(label, command, timeout, cwd, outputs, failures))
+        thread.start()
+        threads.append(thread)
+    for thread in threads:
+        thread.join()
+    if failures:
+        for label in failures:
+            error(f"Error running: {commands[label]}")
+        raise RuntimeError(f"Commands failed: {', '.join(failures)}")
+    return outputs
+
+
+class _Profile:
+    """Wall time, CPU time, and growth of the peak RSS accumulated over named phases."""
+
+    def __init__(self, dump_path: Optional[str] = None):
+        self.phases: Dict[str, Dict[str, float]] = {}
+        self.lock = threading.Lock()
+        self.dump_path = dump_path
+        self.profiler = cProfile.Profile() if dump_path else None
+        self.thread_profilers: List[cProfile.Profile] = []
+        self.start = time.perf_counter()
+        self.start_rss = _peak_rss_mib()
+
+    def record(self, name: str, wall: float, cpu: float, rss: float):
+        with self.lock:
+            totals = self.phases.setdefault(name, {"calls": 0, "wall": 0.0, "cpu": 0.0, "rss": 0.0})
+            totals["calls"] += 1
+            totals["wall"] += wall
+            totals["cpu"] += cpu
+            totals["rss"] += rss
+
+    def report(self):
+        if self.profiler:
+            self.profiler.disable()
+            stats = pstats.Stats(self.profiler)
+            for profiler in self.thread_profilers:
+                stats.add(profiler)
+            stats.dump_stats(self.dump_path)
+            info(f"=>  Wrote pstats dump to {self.dump_path}")
+        total = time.perf_counter() - self.start
+        width = max([len("phase")] + [len(name) for name in self.phases])
+        info(f"{'phase':<{width}} {'calls':>7} {'wall s':>10} {'cpu s':>10} {'peak RSS +MiB':>13}")
+        for name, totals in self.phases.items():
+            info(f"{name:<{width}} {totals['calls']:>7} {totals['wall']:>10.3f} "
+                 f"{totals['cpu']:>10.3f} {totals['rss']:>13.1f}")
+        info(f"{'total':<{width}} {'':>7} {total:>10.3f} {time.process_time():>10.3f} "
+             f"{_peak_rss_mib() - self.start_rss:>13.1f}")
+
+
+_profile: Optional[_Profile] = None
+_thread_profiling = threading.local()
+
+
+def _peak_rss_mib() -> float:
+    """Return the peak resident set size of this process in MiB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def add_profile_arguments(parser):
+    """Add the --profile and --profile-dump options to PARSER."""
+    parser.add_argument("--profile", action="store_true",
+                        help="print wall time, CPU time, and peak RSS growth per phase at exit")
+    parser.add_argument("--profile-dump", metavar="PATH",
+                        help="also write a cProfile pstats dump to PATH (implies --profile)")
+
+
+def start_profiling(dump_path: Optional[str] = None):
+    """Record phases from now on and print a summary table at exit.
+    Profile the main thread with cProfile when DUMP_PATH is given."""
+    global _profile
+    _profile = _Profile(dump_path)
+    if _profile.profiler:
+        _profile.profiler.enable()
+    atexit.register(_profile.report)
+
+
+def start_profiling_if_requested(args):
+    """Call start_profiling when ARGS parsed by add_profile_arguments ask for it."""
+    if args.profile or args.profile_dump:
+        start_profiling(args.profile_dump)
+
+
+def profiled(func):
+    """Wrap FUNC to run under its own cProfile profiler when called on a thread
+    other than the main one, which start_profiling profiles, so that the pstats
+    dump covers worker threads too."""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if (_profile is None or _profile.profiler is None
+                or threading.current_thread() is threading.main_thread()
+                or getattr(_thread_profiling, "active", False)):
+            return func(*args, **kwargs)
+        profiler = cProfile.Profile()
+        _thread_profiling.active = True
+        profiler.enable()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            profiler.disable()
+            _thread_profiling.active = False
+            with _profile.lock:
+                _profile.thread_profilers.append(profiler)
+    return wrapper
+
+
+@contextmanager
+def phase(name: str):
+    """Attribute the time spent in this context, and the growth of the process's peak RSS
+    while in it, to the phase NAME. A phase that allocates no more than an earlier one
+    freed adds nothing to the peak, and phases running concurrently each see the growth.
+    Do nothing unless profiling has been started."""
+    if _profile is None:
+        yield
+        return
+    wall, cpu, rss = time.perf_counter(), time.thread_time(), _peak_rss_mib()
+    try:
+        yield
+    finally:
+        _profile.record(name, time.perf_counter() - wall, time.thread_time() - cpu, _peak_rss_mib() - rss)
@@ -0,0 +1,143 @@
+""" This script monitors the progress of one or more WFL workloads, such as AoU or SG workloads.
+The status of every workflow is cached in a local file. The first poll of a workload fetches all of its
+workflows; later polls fetch only the workflows with an active status and the (few) that Failed or were
+Aborted. A cached active workflow missing from both has Succeeded. So polling costs grow with the active
+and failed workflows rather than with the size of the workload. WFL lists the workflows it has not yet
+submitted without a uuid, so they are only counted: a later poll assumes each newly seen workflow was
+one of them. A workflow that is added or still unsubmitted and then Succeeds between two polls is only
+seen by a full refetch, which --resync does every so many polls. """
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from collections import Counter
+from google.oauth2 import service_account
+
+OPS_DIR = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.append(OPS_DIR)
+sys.path.append(os.path.join(os.path.dirname(OPS_DIR), 'functions'))
+from util.misc import add_profile_arguments, info, phase, start_profiling_if_requested
+from wfl_client import AsyncClient, CredentialsTokenProvider
+
+ACTIVE_STATUSES = ['Aborting', 'On Hold', 'Running', 'Submitted']
+UNSUCCESSFUL_STATUSES = ['Aborted', 'Failed']
+FINAL_STATUSES = UNSUCCESSFUL_STATUSES + ['Succeeded']
+QUEUED_STATUSES = ['On Hold', 'Submitted']
+WFL_SCOPES = ['email', 'openid', 'profile']
+
+
+def load_cache(cache_path):
+    """Load the cached workflow statuses and unsubmitted count of each workload."""
+    if not os.path.exists(cache_path):
+        return {}
+    with open(cache_path) as f:
+        return json.load(f)
+
+def save_cache(cache_path, cache):
+    with open(f"{cache_path}.tmp", "w") as f:
+        json.dump(cache, f)
+    os.replace(f"{cache_path}.tmp", cache_path)
+
+async def fetch_statuses(client, workload, statuses):
+    """Fetch the status of the workflows in workload with one of statuses."""
+    results = await asyncio.gather(*[client.get_workflows(workload, status=s) for s in statuses])
+    return {wf['uuid']: wf.get('status') for workflows in results for wf in workflows if 'uuid' in wf}
+
+async def poll_workload(client, workload, cached, resync=False):
+    """Return the status of every submitted workflow in workload by uuid, and the number of
+    workflows not yet submitted, updating the cached ones."""
+    if resync or not cached:
+        workflows = await client.get_workflows(workload)
+        statuses = {wf['uuid']: wf.get('status') for wf in workflows if 'uuid' in wf}
+        return statuses, sum(1 for wf in workflows if 'uuid' not in wf)
+    statuses = dict(cached['statuses'])
+    active, unsuccessful = await asyncio.gather(fetch_statuses(client, workload, ACTIVE_STATUSES),
+                                                fetch_statuses(client, workload, UNSUCCESSFUL_STATUSES))
+    statuses.update(active)
+    statuses.update(unsuccessful)
+    for uuid, status in cached.items():
+        if status in ACTIVE_STATUSES and uuid not in active and uuid not in unsuccessful:
+            statuses[uuid] = 'Succeeded'
+    submitted = len(statuses) - len(cached['statuses'])
+    return statuses, max(0, cached['unsubmitted'] - submitted)
+
+def report(workload, previous, statuses, unsubmitted, history):
+    """Print the status counts, queue backlog, and throughput of workload."""
+    counts = Counter(statuses.values())
+    changed = sum(1 for uuid, status in statuses.items() if previous.get(uuid) != status)
+    finished = sum(counts[status] for status in FINAL_STATUSES)
+    backlog = unsubmitted + sum(counts[status] for status in QUEUED_STATUSES)
+    if unsubmitted:
+        counts['Unsubmitted'] = unsubmitted
+    history.append((time.time(), finished))
+    (start, started), (end, ended) = history[0], history[-1]
+    hours = (end - start) / 3600
+    throughput = f"{(ended - started) / hours:.1f}" if hours > 0 else "-"
+    summary = ", ".join(f"{status} {count}" for status, count in sorted(counts.items()))
+    info(f"{workload}: {len(statuses) + unsubmitted} workflows ({summary}); {changed} changed; "
+         f"backlog {backlog}; {throughput} workflows/hour")
+
+async def monitor(workloads, client, cache_path, interval, resync, once):
+    cache = load_cache(cache_path)
+    histories = {workload: [] for workload in workloads}
+    polls = 0
+    while True:
+        with phase("polling"):
+            results = await asyncio.gather(*[
+                poll_workload(client, workload, cache.get(workload, {}), resync and polls % resync == 0)
+                for workload in workloads])
+        for workload, (statuses, unsubmitted) in zip(workloads, results):
+            previous = cache.get(workload, {}).get('statuses', {})
+            report(workload, previous, statuses, unsubmitted, histories[workload])
+            cache[workload] = {'statuses': statuses, 'unsubmitted': unsubmitted}
+        save_cache(cache_path, cache)
+        polls += 1
+        if once:
+            return
+        await asyncio.sleep(interval)
+
+def main(workloads, service_account_key_path, wfl_url, cache_path, interval=300, resync=12, once=False):
+    credentials = service_account.Credentials.from_service_account_file(service_account_key_path,
+                                                                        scopes=WFL_SCOPES)
+    client = AsyncClient(wfl_url=wfl_url, token_provider=CredentialsTokenProvider(credentials))
+    try:
+        asyncio.run(monitor(workloads, client, cache_path, interval, resync, once))
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Monitor the progress of WFL workloads.",
+                                     usage="%(prog)s [-h] [SERVICE_ACCOUNT_KEY_PATH WORKLOAD [WORKLOAD ...]] [...]")
+    parser.add_argument("service_account_key_path",
+                        help="A service account with access to WFL.")
+    parser.add_argument("workloads",
+                        metavar="workload",
+                        nargs="+",
+                        help="The UUIDs of the workloads to monitor.")
+    parser.add_argument("--wfl_url",
+                        default="https://dev-wfl.gotc-dev.broadinstitute.org",
+                        help="The WFL API URL.")
+    parser.add_argument("--cache",
+                        default="workload_statuses.json",
+                        help="The file caching workflow statuses between polls and runs.")
+    parser.add_argument("--interval",
+                        type=float,
+                        default=300,
+                        help="Seconds to wait between polls.")
+    parser.add_argument("--resync",
+                        type=int,
+                        default=12,
+                        help="Refetch every workflow every RESYNC polls, to catch workflows that Succeeded "
+                             "before a poll saw them active. 0 means only on the first poll of a workload.")
+    parser.add_argument("--once",
+                        action="store_true",
+                        help="Poll once and exit.")
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+    start_profiling_if_requested(args)
+    main(args.workloads, args.service_account_key_path, args.wfl_url, args.cache, args.interval,
+         args.resync, args.once)